@@ -1,35 +1,735 @@
+import asyncio
+import bisect
 import datetime as dt
+import hashlib
+import inspect
+import itertools
 import json
-from typing import Dict, List, Any, Set
+import mmap
+import os
+import socket
+import struct
+import sys
+import tempfile
+import typing
+from array import array
+from collections.abc import Sequence
+from typing import Callable, Dict, Iterable, List, Any, Optional, Set, Tuple
 import uuid
+import weakref
+
+
+_EPOCH = dt.datetime(1, 1, 1)
+_MICROSECOND = dt.timedelta(microseconds=1)
+# пока мусора в журнале и массивах друзей меньше этого, они не пересобираются
+_COMPACT_MIN = 1024
+# с такой степени повторы друзей ищутся по множеству, а не перебором
+_HUB_DEGREE = 64
+# сколько строк uuid граф держит готовыми для повторных чтений _id
+_ID_CACHE_SIZE = 1 << 16
+_NO_ID = bytes(16)
+# место под друзей, которое узел получает сразу при создании; дальше строка удваивается
+_ROW_MIN = 4
+_EMPTY_ROW = array('I', [0]) * _ROW_MIN
+
+
+def _to_micros(moment: dt.datetime) -> int:
+    if moment.tzinfo is not None:
+        raise ValueError("born_in должен быть без tzinfo")
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> dt.datetime:
+    return _EPOCH + dt.timedelta(0, 0, micros)
+
+
+# счётчик поколений, растёт при каждом изменении любого графа; он не атрибут
+# класса, потому что запись в класс сбрасывает кэши атрибутов интерпретатора
+_generation = 0
+# последнее поколение, выданное наружу; см. PersonGraph._log
+_checkpoint = 0
+
+
+def _tick() -> int:
+    global _generation
+    _generation += 1
+    return _generation
+
+
+def _shortest_path(neighbours: Callable[[int], Iterable[int]],
+                   start: int, goal: int) -> Optional[List[int]]:
+    """двунаправленный BFS, растёт та сторона, у которой фронт меньше"""
+    if start == goal:
+        return [start]
+    # номер -> (родитель, расстояние) для каждой из сторон
+    sides: List[Dict[int, Tuple[Optional[int], int]]] = [{start: (None, 0)}, {goal: (None, 0)}]
+    frontiers = [[start], [goal]]
+
+    while frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        visited, other = sides[side], sides[1 - side]
+        next_frontier = []
+        best: Optional[Tuple[int, int, int]] = None
+        for node in frontiers[side]:
+            distance = visited[node][1] + 1
+            for friend in neighbours(node):
+                if friend in other:
+                    # уровень дорабатываем до конца, чтобы взять кратчайшую встречу
+                    total = distance + other[friend][1]
+                    if best is None or total < best[0]:
+                        best = (total, node, friend)
+                if friend not in visited:
+                    visited[friend] = (node, distance)
+                    next_frontier.append(friend)
+        if best is not None:
+            _, node, friend = best
+            path = _trace(visited, node)
+            path.reverse()
+            path.extend(_trace(other, friend))
+            return path if side == 0 else path[::-1]
+        frontiers[side] = next_frontier
+    return None
+
+
+def _trace(parents: Dict[int, Tuple[Optional[int], int]], node: Optional[int]) -> List[int]:
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parents[node][0]
+    return path
+
+
+def _neighbourhood(neighbours: Callable[[int], Iterable[int]],
+                   start: int, hops: int) -> List[int]:
+    """все узлы не дальше hops шагов, без самого start, в порядке BFS"""
+    visited = {start}
+    frontier = [start]
+    result: List[int] = []
+    for _ in range(hops):
+        next_frontier = []
+        for node in frontier:
+            for friend in neighbours(node):
+                if friend not in visited:
+                    visited.add(friend)
+                    next_frontier.append(friend)
+        result.extend(next_frontier)
+        frontier = next_frontier
+        if not frontier:
+            break
+    return result
+
+
+def _bisect(order: array, keys: array, key: int, low: int = 0, right: bool = False) -> int:
+    """bisect по номерам узлов, отсортированным по keys[номер]"""
+    high = len(order)
+    while low < high:
+        middle = (low + high) // 2
+        found = keys[order[middle]]
+        if found < key or right and found == key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _merge_runs(order: array, new: Iterable[int], keys: array) -> array:
+    # слияние двух серий: цикл только по новым узлам, старые куски
+    # копируются срезами массивов; у новых номера больше, поэтому среди
+    # равных ключей узлы остаются по возрастанию номера
+    merged = array('I')
+    start = 0
+    for number in sorted(new, key=keys.__getitem__):
+        position = _bisect(order, keys, keys[number], start, right=True)
+        merged += order[start:position]
+        merged.append(number)
+        start = position
+    merged += order[start:]
+    return merged
+
+
+class PersonIndex:
+    """вторичные индексы графа, догоняют граф при первом запросе после изменений
+
+    индекс - перестановка номеров узлов, отсортированная по столбцу графа;
+    сами ключи берутся из столбца и отдельно не хранятся
+    """
+
+    def __init__(self, graph: 'PersonGraph') -> None:
+        self._graph = graph
+        # номера узлов по возрастанию born_in и по номеру имени
+        self._born_order = array('I')
+        self._name_order = array('I')
+        # узлы с номерами от _indexed ещё не влиты в порядки
+        self._indexed = 0
+
+    def _live(self) -> 'PersonIndex':
+        # граф мог быть влит в другой - тогда отвечает индекс того графа
+        graph = self._graph._live()
+        index = self if graph is self._graph else graph.index
+        total = len(graph)
+        if index._indexed < total:
+            new = range(index._indexed, total)
+            index._born_order = _merge_runs(index._born_order, new, graph._born_in)
+            index._name_order = _merge_runs(index._name_order, new, graph._name_of)
+            index._indexed = total
+        return index
+
+    def _own(self, person: 'Person') -> int:
+        if person._graph is not self._graph:
+            raise ValueError("человек из другого графа")
+        return person._number
+
+    def born_between(self, start: dt.datetime, end: dt.datetime) -> List['Person']:
+        """люди с start <= born_in <= end по возрастанию даты"""
+        index = self._live()
+        graph = index._graph
+        order = index._born_order
+        low = _bisect(order, graph._born_in, _to_micros(start))
+        high = _bisect(order, graph._born_in, _to_micros(end), low, right=True)
+        return [graph.person(number) for number in order[low:high]]
+
+    def by_name(self, name: str) -> List['Person']:
+        index = self._live()
+        graph = index._graph
+        name_number = graph._name_numbers.get(name)
+        if name_number is None:
+            return []
+        order = index._name_order
+        low = _bisect(order, graph._name_of, name_number)
+        high = _bisect(order, graph._name_of, name_number, low, right=True)
+        return [graph.person(number) for number in order[low:high]]
+
+    def degree(self, person: 'Person') -> int:
+        index = self._live()
+        return index._graph.degree(index._own(person))
+
+    def shortest_path(self, first: 'Person', second: 'Person') -> Optional[List['Person']]:
+        """кратчайшая цепочка знакомств или None, если её нет"""
+        index = self._live()
+        graph = index._graph
+        path = _shortest_path(graph.neighbours, index._own(first), index._own(second))
+        if path is None:
+            return None
+        return [graph.person(number) for number in path]
+
+    def neighbourhood(self, person: 'Person', hops: int = 2) -> List['Person']:
+        """друзья, друзья друзей и т.д. до hops шагов"""
+        index = self._live()
+        graph = index._graph
+        return [graph.person(number)
+                for number in _neighbourhood(graph.neighbours, index._own(person), hops)]
+
+
+class GraphView:
+    """неизменный срез графа на момент создания (копирование при записи)
+
+    номера узлов в срезе - те, что были в момент создания; если граф потом
+    вливается в другой, срез переезжает вместе с ним и номера не меняются
+    """
+
+    def __init__(self, graph: 'PersonGraph') -> None:
+        self._graph = graph
+        self._size = len(graph)
+        # где в нынешнем графе узел 0 среза, растёт при слиянии графов
+        self._offset = 0
+        # прежние списки друзей узлов, изменённых после создания среза
+        self._saved: Dict[int, array] = {}
+        graph._views.append(self)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __enter__(self) -> 'GraphView':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self in self._graph._views:
+            self._graph._views.remove(self)
+        self._saved.clear()
+
+    def _before_change(self, number: int) -> None:
+        # узлы новее среза в нём не видны, их сохранять не нужно
+        number -= self._offset
+        if 0 <= number < self._size and number not in self._saved:
+            self._saved[number] = self._current(number)
+
+    def _current(self, number: int) -> array:
+        friends = self._graph.neighbours(number + self._offset)
+        if self._offset:
+            # у неизменённого узла все друзья из среза, сдвиг обратим
+            friends = array('I', map((-self._offset).__add__, friends))
+        return friends
+
+    def neighbours(self, number: int) -> array:
+        saved = self._saved.get(number)
+        if saved is not None:
+            return saved
+        return self._current(number)
+
+    def person(self, number: int) -> 'Person':
+        return self._graph.person(number + self._offset)
+
+
+class PersonGraph:
+    """хранилище людей по столбцам: массивы вместо отдельных объектов
+
+    на каждый узел ровно один Person, он хранится в графе; поэтому Person
+    сравниваются и хешируются по тождеству, как обычные объекты
+    """
+
+    def __init__(self) -> None:
+        self._people: List['Person'] = []
+        self._names: List[str] = []
+        self._name_numbers: Dict[str, int] = {}
+        self._name_of = array('I')
+        self._born_in = array('q')
+        # нулевые 16 байт - uuid ещё не выдан, он создаётся при первом чтении
+        self._ids = bytearray()
+        # строки недавно прочитанных uuid, не больше _ID_CACHE_SIZE
+        self._id_strings: Dict[int, str] = {}
+        # журнал изменений: номер узла и поколение, поколения по возрастанию
+        self._log_numbers = array('I')
+        self._log_generations = array('Q')
+        # поколение последнего изменения каждого узла
+        self._generations = array('Q')
+        # CSR с запасом: друзья узла i - _targets[_starts[i]:_starts[i] + _degrees[i]];
+        # строка растёт на месте до _capacities[i], потом переезжает в конец
+        self._starts = array('Q')
+        self._degrees = array('I')
+        self._capacities = array('I')
+        self._targets = array('I')
+        # ячейки _targets, брошенные переехавшими строками
+        self._waste = 0
+        # друзья узлов со степенью от _HUB_DEGREE, для проверки повторов за O(1)
+        self._hubs: Dict[int, Set[int]] = {}
+        self.index = PersonIndex(self)
+        # открытые срезы, им нужны старые списки друзей перед изменением
+        self._views: List[GraphView] = []
+        # после слияния: (граф, куда перенесены узлы, сдвиг номеров)
+        self._forward: Optional[Tuple['PersonGraph', int]] = None
+
+    def _live(self) -> 'PersonGraph':
+        # граф мог быть влит в другой - узлы теперь там
+        graph = self
+        while graph._forward is not None:
+            graph = graph._forward[0]
+        return graph
+
+    def __len__(self) -> int:
+        return len(self._born_in)
+
+    def person(self, number: int) -> 'Person':
+        return self._people[number]
+
+    def add_node(self, name: str, born_in: dt.datetime) -> int:
+        """добавление узла, возвращает его номер"""
+        return Person(name, born_in, self)._number
+
+    def _append(self, person: 'Person', name: str, born_in: dt.datetime) -> int:
+        # столбцы растут на один элемент, вызывается из Person.__init__
+        micros = _to_micros(born_in)
+        name_number = self._name_numbers.get(name)
+        if name_number is None:
+            name_number = self._name_numbers[name] = len(self._names)
+            self._names.append(name)
+        number = len(self._people)
+        generation = _tick()
+        self._people.append(person)
+        self._born_in.append(micros)
+        self._name_of.append(name_number)
+        self._ids += _NO_ID
+        self._generations.append(generation)
+        self._starts.append(len(self._targets))
+        self._degrees.append(0)
+        self._capacities.append(_ROW_MIN)
+        self._targets += _EMPTY_ROW
+        # новый узел в журнале ещё не записан, _log здесь не нужен
+        self._log_numbers.append(number)
+        self._log_generations.append(generation)
+        if len(self._log_numbers) > 2 * len(self._born_in) + _COMPACT_MIN:
+            self._trim_log()
+        return number
+
+    def _name_number(self, name: str) -> int:
+        name_number = self._name_numbers.get(name)
+        if name_number is None:
+            name_number = self._name_numbers[name] = len(self._names)
+            self._names.append(name)
+        return name_number
+
+    def _id_string(self, number: int) -> str:
+        start = number * 16
+        key = self._ids[start:start + 16]
+        if key == _NO_ID:
+            key = uuid.uuid4().bytes
+            self._ids[start:start + 16] = key
+        text = key.hex()
+        value = f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+        self._cache_id(number, value)
+        return value
+
+    def _set_id(self, number: int, value: str) -> None:
+        # то же, что uuid.UUID(value).bytes, но без создания объекта UUID
+        key = bytes.fromhex(value.replace('-', ''))
+        if len(key) != 16:
+            raise ValueError("id должен быть uuid")
+        start = number * 16
+        self._ids[start:start + 16] = key
+        if len(self._id_strings) >= _ID_CACHE_SIZE:
+            self._id_strings.clear()
+        self._id_strings[number] = value
+
+    def _cache_id(self, number: int, value: str) -> None:
+        if len(self._id_strings) >= _ID_CACHE_SIZE:
+            # строки не копятся на каждый узел: кэш просто начинается заново
+            self._id_strings.clear()
+        self._id_strings[number] = value
+
+    def neighbours(self, number: int) -> array:
+        """номера друзей узла"""
+        start = self._starts[number]
+        return self._targets[start:start + self._degrees[number]]
+
+    def degree(self, number: int) -> int:
+        """число друзей без копирования строки"""
+        return self._degrees[number]
+
+    def _grow(self, number: int, capacity: int) -> None:
+        # последняя строка растёт на месте, остальные переезжают в конец;
+        # запас за _degrees[number] не читается, его заполняют нули
+        targets = self._targets
+        start, size = self._starts[number], self._capacities[number]
+        if start + size != len(targets):
+            self._waste += size
+            size = self._degrees[number]
+            self._starts[number] = len(targets)
+            targets += targets[start:start + size]
+        targets.frombytes(bytes(targets.itemsize * (capacity - size)))
+        self._capacities[number] = capacity
+
+    def _log(self, number: int, generation: int) -> None:
+        # узел, уже записанный после последней контрольной точки, второй раз
+        # не пишется: changed_since спрашивают только о контрольных точках
+        if self._generations[number] <= _checkpoint:
+            self._log_numbers.append(number)
+            self._log_generations.append(generation)
+            if len(self._log_numbers) > 2 * len(self._born_in) + _COMPACT_MIN:
+                self._trim_log()
+        self._generations[number] = generation
+
+    def _trim_log(self) -> None:
+        # от старых записей узла толку нет - оставляем последнюю на узел
+        order = sorted(range(len(self)), key=self._generations.__getitem__)
+        self._log_numbers = array('I', order)
+        self._log_generations = array('Q', map(self._generations.__getitem__, order))
+
+    def changed_since(self, generation: int) -> List[int]:
+        """узлы, добавленные или изменённые после поколения generation
+
+        generation - значение, полученное от Person.current_generation()
+        """
+        start = bisect.bisect_right(self._log_generations, generation)
+        return list(dict.fromkeys(self._log_numbers[start:]))
+
+    def _hub(self, number: int) -> Set[int]:
+        hub = self._hubs.get(number)
+        if hub is None:
+            hub = self._hubs[number] = set(self.neighbours(number))
+        return hub
+
+    def add_edge(self, first: int, second: int) -> None:
+        """дружба в обе стороны, повторная не добавляется"""
+        # самый частый вызов при построении графа, поэтому обе стороны
+        # дописываются здесь же, без вызова _tick
+        global _generation
+        degrees, starts, targets = self._degrees, self._starts, self._targets
+        size = degrees[first]
+        if size < _HUB_DEGREE:
+            start = starts[first]
+            if second in targets[start:start + size]:
+                return
+        elif second in self._hub(first):
+            return
+        for view in self._views:
+            view._before_change(first)
+            view._before_change(second)
+
+        _generation += 1
+        capacities = self._capacities
+        grown = False
+        if size == capacities[first]:
+            self._grow(first, max(2 * size, _ROW_MIN))
+            grown = True
+        targets[starts[first] + size] = second
+        degrees[first] = size + 1
+        size = degrees[second]
+        if size == capacities[second]:
+            self._grow(second, max(2 * size, _ROW_MIN))
+            grown = True
+        targets[starts[second] + size] = first
+        degrees[second] = size + 1
+
+        if self._hubs:
+            for number, friend in ((first, second), (second, first)):
+                hub = self._hubs.get(number)
+                if hub is not None:
+                    hub.add(friend)
+        generations = self._generations
+        if generations[first] <= _checkpoint or generations[second] <= _checkpoint:
+            self._log(first, _generation)
+            self._log(second, _generation)
+        else:
+            generations[first] = generations[second] = _generation
+        # мусор появляется только при переезде строки
+        if grown:
+            self._maybe_compact()
+
+    def append_neighbour(self, number: int, friend: int) -> None:
+        """связь только в одну сторону, без проверки повторов"""
+        for view in self._views:
+            view._before_change(number)
+        size = self._degrees[number]
+        grown = size == self._capacities[number]
+        if grown:
+            self._grow(number, max(2 * size, _ROW_MIN))
+        self._targets[self._starts[number] + size] = friend
+        self._degrees[number] = size + 1
+        if self._hubs:
+            hub = self._hubs.get(number)
+            if hub is not None:
+                hub.add(friend)
+        self._log(number, _tick())
+        if grown:
+            self._maybe_compact()
+
+    def set_neighbours(self, number: int, friends: Iterable[int]) -> None:
+        """замена списка друзей узла, тоже в одну сторону"""
+        friends = array('I', friends)
+        for view in self._views:
+            view._before_change(number)
+        if len(friends) > self._capacities[number]:
+            self._grow(number, len(friends))
+        start = self._starts[number]
+        self._targets[start:start + len(friends)] = friends
+        self._degrees[number] = len(friends)
+        self._hubs.pop(number, None)
+        self._log(number, _tick())
+        self._maybe_compact()
+
+    def _merge(self, other: 'PersonGraph') -> 'PersonGraph':
+        """слияние с other, меньший граф вливается в больший; возвращает оставшийся"""
+        if len(self) < len(other):
+            return other._merge(self)
+        self._absorb(other)
+        return self
+
+    def _absorb(self, other: 'PersonGraph') -> None:
+        """перенос всех узлов other в конец этого графа"""
+        shift = len(self)
+        names = [self._name_number(name) for name in other._names]
+        self._name_of.extend(map(names.__getitem__, other._name_of))
+        self._born_in.extend(other._born_in)
+        self._ids += other._ids
+        self._generations.extend(itertools.repeat(0, len(other)))
+        # Person остаются теми же объектами, меняется только их адрес
+        for number, person in enumerate(other._people, shift):
+            person._graph = self
+            person._number = number
+        self._people.extend(other._people)
+
+        # строки other переносятся целиком, номера друзей сдвигаются на shift
+        other.compact()
+        self._starts.extend(map(len(self._targets).__add__, other._starts))
+        self._degrees.extend(other._degrees)
+        self._capacities.extend(other._degrees)
+        self._targets.extend(map(shift.__add__, other._targets))
+
+        generation = _tick()
+        for number in range(shift, len(self)):
+            self._log(number, generation)
+
+        # открытые срезы other переезжают сюда, их номера сдвигаются на shift
+        for view in other._views:
+            view._graph = self
+            view._offset += shift
+        self._views.extend(other._views)
+
+        # освобождаем массивы other; старые ссылки на него и на его index
+        # ведут сюда через _forward
+        PersonGraph.__init__(other)
+        other._forward = (self, shift)
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        # пересборка окупается, когда брошенных ячеек больше половины массивов
+        if self._waste > _COMPACT_MIN + (len(self._born_in) + len(self._targets)) // 2:
+            self.compact()
+
+    def view(self) -> GraphView:
+        """срез графа, который не меняется при add_friend; закрыть после чтения"""
+        return GraphView(self)
+
+    def compact(self) -> None:
+        """плотная упаковка строк: CSR без запаса и без брошенных ячеек"""
+        old = self._targets
+        targets = array('I')
+        for start, size in zip(self._starts, self._degrees):
+            targets += old[start:start + size]
+        self._starts = array('Q', itertools.accumulate(self._degrees, initial=0))
+        self._starts.pop()
+        self._capacities = array('I', self._degrees)
+        self._targets = targets
+        self._waste = 0
+
+
+_shared: Optional['weakref.ref[PersonGraph]'] = None
+
+
+def _shared_graph() -> PersonGraph:
+    """общий граф для Person без graph, живёт, пока жив хоть один такой Person"""
+    global _shared
+    graph = None if _shared is None else _shared()
+    if graph is None or graph._forward is not None:
+        graph = PersonGraph() if graph is None else graph._live()
+        _shared = weakref.ref(graph)
+    return graph
+
+
+class _FriendList(Sequence):
+    """живой список друзей человека, нужен кодировщикам с прямым доступом"""
+
+    __slots__ = ('_person',)
+
+    def __init__(self, person: 'Person') -> None:
+        self._person = person
+
+    def __len__(self) -> int:
+        person = self._person
+        return person._graph.degree(person._number)
+
+    def __getitem__(self, index):
+        person = self._person
+        people = person._graph._people
+        numbers = person._graph.neighbours(person._number)
+        if isinstance(index, slice):
+            return [people[number] for number in numbers[index]]
+        return people[numbers[index]]
+
+    def __iter__(self):
+        person = self._person
+        graph = person._graph
+        return map(graph._people.__getitem__, graph.neighbours(person._number))
+
+    def __contains__(self, friend: Any) -> bool:
+        person = self._person
+        return (isinstance(friend, Person) and friend._graph is person._graph
+                and friend._number in person._graph.neighbours(person._number))
+
+    def append(self, friend: 'Person') -> None:
+        person = self._person
+        graph = person._graph
+        if friend._graph is not graph:
+            graph = person._join(friend)
+        graph.append_neighbour(person._number, friend._number)
+
+    def copy(self) -> List['Person']:
+        return list(self)
 
 
 class Person:
-    def __init__(self, name: str, born_in: dt.datetime) -> None:
+    """лёгкая ссылка на узел PersonGraph
+
+    без graph человек попадает в общий граф; если у друзей разные графы,
+    add_friend сливает их, меньший вливается в больший
+    """
+
+    __slots__ = ('_graph', '_number')
+
+    def __init__(self, name: str, born_in: dt.datetime,
+                 graph: Optional[PersonGraph] = None) -> None:
         """создаём Person"""
-        self._name = name
-        self._friends: List['Person'] = []
-        self._born_in = born_in
-        self._id = str(uuid.uuid4())
+        if graph is None:
+            graph = _shared_graph()
+        elif graph._forward is not None:
+            graph = graph._live()
+        self._graph = graph
+        self._number = graph._append(self, name, born_in)
+
+    def _join(self, other: 'Person') -> PersonGraph:
+        # общий граф для двоих, при необходимости графы сливаются
+        graph = self._graph
+        if other._graph is not graph:
+            graph = graph._merge(other._graph)
+        return graph
+
+    def graph(self) -> PersonGraph:
+        """граф, где сейчас лежит человек; после add_friend с чужим он может смениться"""
+        return self._graph
+
+    @classmethod
+    def current_generation(cls) -> int:
+        """номер последнего изменения графа, он же контрольная точка для changed_since"""
+        global _checkpoint
+        _checkpoint = _generation
+        return _generation
+
+    @classmethod
+    def _decode_context(cls) -> Dict[str, Any]:
+        # CompiledDecoder без graph строит людей в своём графе, а не в общем
+        return {'graph': PersonGraph()}
 
     def add_friend(self, friend: 'Person') -> None:
         """добавление друга"""
-        if friend not in self._friends:
-            self._friends.append(friend)
-            friend._friends.append(self)
+        graph = self._graph
+        if friend._graph is not graph:
+            graph = graph._merge(friend._graph)
+        graph.add_edge(self._number, friend._number)
 
     @property
     def name(self) -> str:
-        return self._name
+        graph = self._graph
+        return graph._names[graph._name_of[self._number]]
 
     @property
     def born_in(self) -> dt.datetime:
-        return self._born_in
+        return _EPOCH + dt.timedelta(0, 0, self._graph._born_in[self._number])
 
     @property
     def friends(self) -> List['Person']:
         """копия списка друзей"""
-        return self._friends.copy()
+        graph = self._graph
+        return list(map(graph._people.__getitem__, graph.neighbours(self._number)))
+
+    # внутренние поля прежнего Person, на них опираются кодировщики
+    @property
+    def _id(self) -> str:
+        graph = self._graph
+        value = graph._id_strings.get(self._number)
+        if value is None:
+            value = graph._id_string(self._number)
+        return value
+
+    @_id.setter
+    def _id(self, value: str) -> None:
+        self._graph._set_id(self._number, value)
+
+    _name = name
+    _born_in = born_in
+
+    @property
+    def _friends(self) -> _FriendList:
+        return _FriendList(self)
+
+    @_friends.setter
+    def _friends(self, friends: Iterable['Person']) -> None:
+        friends = list(friends)
+        graph = self._graph
+        for friend in friends:
+            graph = self._join(friend)
+        graph.set_neighbours(self._number, [friend._number for friend in friends])
 
 class PersonEncoderPrivate:
     """кодировщик безнарушений инкапсуляции"""
@@ -65,8 +765,11 @@ class PersonEncoderPrivate:
 
 class PersonDecoderPrivate:
 
-    def decode(self, data: bytes) -> Person:
+    def decode(self, data: bytes, graph: Optional[PersonGraph] = None) -> Person:
         """десериализация с созданием объектов через конструктор"""
+        # каждый вызов строит свой граф, он освобождается вместе с результатом
+        if graph is None:
+            graph = PersonGraph()
         json_data = json.loads(data.decode('utf-8'))
         objects_data = json_data['objects']
         root_id = json_data['root_id']
@@ -75,7 +778,7 @@ class PersonDecoderPrivate:
         objects: Dict[str, Person] = {}
         for obj_id, obj_data in objects_data.items():
             born_in = dt.datetime.fromisoformat(obj_data['born_in'])
-            person = Person(obj_data['name'], born_in)
+            person = Person(obj_data['name'], born_in, graph)
             person._id = obj_id
             objects[obj_id] = person
 
@@ -124,8 +827,11 @@ class PersonEncoderPublic:
 class PersonDecoderPublic:
     """С нарушением инкапсуляции"""
 
-    def decode(self, data: bytes) -> Person:
+    def decode(self, data: bytes, graph: Optional[PersonGraph] = None) -> Person:
         """десериализация с прямым доступом к приватным атрибутам"""
+        # каждый вызов строит свой граф, он освобождается вместе с результатом
+        if graph is None:
+            graph = PersonGraph()
         json_data = json.loads(data.decode('utf-8'))
         objects_data = json_data['objects']
         root_id = json_data['root_id']
@@ -134,7 +840,7 @@ class PersonDecoderPublic:
         objects: Dict[str, Person] = {}
         for obj_id, obj_data in objects_data.items():
             born_in = dt.datetime.fromisoformat(obj_data['born_in'])
-            person = Person(obj_data['name'], born_in)
+            person = Person(obj_data['name'], born_in, graph)
             person._id = obj_id
             objects[obj_id] = person
 
@@ -149,6 +855,803 @@ class PersonDecoderPublic:
         return objects[root_id]
 
 
+class DeltaEncoder:
+    """кодировщик изменений относительно базового снимка"""
+
+    def __init__(self, since: int = 0, base: Optional[bytes] = None) -> None:
+        """since=0 - первый вызов encode даёт полный (базовый) снимок
+
+        base - снимок, на который ляжет первая дельта, если его писал другой
+        кодировщик; без него при since > 0 состав базы неизвестен, и первая
+        дельта несёт всех достижимых от изменённых узлов
+        """
+        self._since = since
+        # люди, уже отправленные этим кодировщиком
+        self._sent: Set[Person] = set()
+        # id людей из чужой базы, None - база неизвестна
+        self._base_ids: Optional[Set[str]] = None
+        if base is not None:
+            self._base_ids = set(json.loads(base.decode('utf-8'))['objects'])
+        elif since == 0:
+            self._base_ids = set()
+
+    @property
+    def since(self) -> int:
+        return self._since
+
+    def _known(self, person: Person) -> bool:
+        # есть ли человек у получателя после базы и прошлых дельт
+        return person in self._sent or (
+            self._base_ids is not None and person._id in self._base_ids)
+
+    def encode(self, obj: Person) -> bytes:
+        """сериализация только новых и изменённых узлов
+
+        изменённый узел передаётся целиком вместе со списком друзей,
+        после вызова следующая дельта считается от текущего поколения;
+        узлы берутся из журнала графа, весь граф не обходится. Друзья,
+        которых получатель ещё не видел, добавляются в дельту, даже если
+        сами не менялись, иначе их id не на что разрешить
+        """
+        graph = obj._graph
+        generation = Person.current_generation()
+        objects: Dict[str, Dict] = {}
+
+        queue = [graph.person(number) for number in graph.changed_since(self._since)]
+        included = set(queue)
+        if obj not in included and not self._known(obj):
+            included.add(obj)
+            queue.append(obj)
+        # очередь растёт по ходу цикла за счёт новых для получателя друзей
+        for person in queue:
+            friends = person._friends
+            objects[person._id] = {
+                'name': person._name,
+                'born_in': person._born_in.isoformat(),
+                'friends': [friend._id for friend in friends]
+            }
+            for friend in friends:
+                if friend not in included and not self._known(friend):
+                    included.add(friend)
+                    queue.append(friend)
+        self._sent |= included
+
+        data = {
+            'objects': objects,
+            'root_id': obj._id,
+            'base_generation': self._since,
+            'generation': generation
+        }
+        self._since = generation
+        return json.dumps(data, indent=2).encode('utf-8')
+
+
+class DeltaDecoder:
+    """восстановление графа из базового снимка и цепочки дельт"""
+
+    def _merge(self, base: bytes, deltas: Iterable[bytes]) -> Dict[str, Any]:
+        json_data = json.loads(base.decode('utf-8'))
+        objects_data = json_data['objects']
+        root_id = json_data['root_id']
+        generation = json_data.get('generation')
+
+        for delta in deltas:
+            delta_data = json.loads(delta.decode('utf-8'))
+            # базовый снимок от PersonEncoderPrivate не знает своего поколения
+            if generation is not None and delta_data['base_generation'] != generation:
+                raise ValueError("дельта не подходит к снимку")
+            # более новая запись узла полностью заменяет старую
+            objects_data.update(delta_data['objects'])
+            root_id = delta_data['root_id']
+            generation = delta_data['generation']
+
+        data = {
+            'objects': objects_data,
+            'root_id': root_id
+        }
+        if generation is not None:
+            data['generation'] = generation
+        return data
+
+    def decode(self, base: bytes, deltas: Iterable[bytes] = (),
+               graph: Optional[PersonGraph] = None) -> Person:
+        """десериализация базы с применением дельт по порядку"""
+        # каждый вызов строит свой граф, он освобождается вместе с результатом
+        if graph is None:
+            graph = PersonGraph()
+        json_data = self._merge(base, deltas)
+        objects_data = json_data['objects']
+
+        objects: Dict[str, Person] = {}
+        for obj_id, obj_data in objects_data.items():
+            born_in = dt.datetime.fromisoformat(obj_data['born_in'])
+            person = Person(obj_data['name'], born_in, graph)
+            person._id = obj_id
+            objects[obj_id] = person
+
+        for obj_id, obj_data in objects_data.items():
+            person = objects[obj_id]
+            for friend_id in obj_data['friends']:
+                friend = objects.get(friend_id)
+                if friend is None:
+                    raise ValueError(f"в базе и дельтах нет друга {friend_id}")
+                person.add_friend(friend)
+
+        return objects[json_data['root_id']]
+
+    def compact(self, base: bytes, deltas: Iterable[bytes]) -> bytes:
+        """свёртка базы и дельт в один полный снимок"""
+        return json.dumps(self._merge(base, deltas), indent=2).encode('utf-8')
+
+
+# типы, которые пишутся в JSON как есть
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def _unwrap_optional(hint: Any) -> Any:
+    if typing.get_origin(hint) is typing.Union:
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return hint
+
+
+def _is_plain(hint: Any) -> bool:
+    """JSON хранит как есть: скаляры, списки и словари со строковыми ключами из них"""
+    hint = _unwrap_optional(hint)
+    if hint in _PLAIN_TYPES or hint in (list, dict):
+        return True
+    args = typing.get_args(hint)
+    if typing.get_origin(hint) is list:
+        return _is_plain(args[0])
+    if typing.get_origin(hint) is dict:
+        return args[0] is str and _is_plain(args[1])
+    return False
+
+
+def _field_kind(hint: Any) -> Tuple[str, Any]:
+    """вид поля по аннотации property: значение, дата, ссылка или список ссылок"""
+    hint = _unwrap_optional(hint)
+    if _is_plain(hint):
+        return 'plain', hint
+    if typing.get_origin(hint) is list:
+        (item,) = typing.get_args(hint)
+        if isinstance(item, type) and not issubclass(item, dt.date):
+            return 'refs', item
+    elif hint in (dt.datetime, dt.date):
+        return 'date', hint
+    elif isinstance(hint, type):
+        return 'ref', hint
+    raise TypeError(f"не умею сериализовать поле типа {hint!r}")
+
+
+# множественное число, которое не получить отбрасыванием окончания
+_IRREGULAR_PLURALS = {'children': 'child', 'people': 'person', 'men': 'man', 'women': 'woman'}
+
+
+def _singular_forms(name: str) -> List[str]:
+    """кандидаты в ед. число для имени поля, от более вероятных к менее"""
+    # в snake_case склоняется только последнее слово: best_friends -> best_friend
+    prefix, _, word = name.rpartition('_')
+    prefix = prefix + '_' if prefix else ''
+    forms = []
+    if word in _IRREGULAR_PLURALS:
+        forms.append(_IRREGULAR_PLURALS[word])
+    if word.endswith('ies'):
+        forms.append(word[:-3] + 'y')
+    if word.endswith('es'):
+        forms.append(word[:-2])
+    if word.endswith('s'):
+        forms.append(word[:-1])
+    forms.append(word)
+    return [prefix + form for form in forms]
+
+
+class _CompiledClass:
+    """сгенерированные функции кодирования и восстановления для одного класса"""
+
+    def __init__(self, cls: type, id_attr: str) -> None:
+        self.cls = cls
+        self.type_name = f"{cls.__module__}.{cls.__qualname__}"
+        self.fields: List[Tuple[str, str, Any]] = []
+
+        # публичные property в порядке объявления, базовые классы первыми
+        seen: Set[str] = set()
+        for klass in reversed(cls.__mro__):
+            for name, attr in vars(klass).items():
+                if isinstance(attr, property) and not name.startswith('_') and name not in seen:
+                    seen.add(name)
+                    # localns - для ссылок на класс, объявленный внутри функции
+                    hint = typing.get_type_hints(
+                        attr.fget, localns={cls.__name__: cls}).get('return')
+                    if hint is None:
+                        raise TypeError(f"у {cls.__name__}.{name} нет аннотации")
+                    self.fields.append((name, *_field_kind(hint)))
+
+        self.encode_fields = self._compile_encode(id_attr)
+        self._id_attr = id_attr
+        self.ref_lists = {name for name, kind, _ in self.fields if kind == 'refs'}
+        self._decode_functions: Dict[Tuple[Tuple[str, str], ...], Tuple[Callable, Callable]] = {}
+
+    def decode_functions(self, adders: Optional[Dict[str, str]] = None) -> Tuple[Callable, Callable]:
+        """create и link, собираются при первом декодировании
+
+        adders - поле-список ссылок -> метод, добавляющий одну ссылку
+        """
+        # для одного кодирования конструктор класса может быть любым
+        key = tuple(sorted((name, method) for name, method in (adders or {}).items()
+                           if name in self.ref_lists))
+        functions = self._decode_functions.get(key)
+        if functions is None:
+            functions = self._decode_functions[key] = self._compile_decode(
+                self._id_attr, dict(key))
+        return functions
+
+    def _compile_encode(self, id_attr: str):
+        lines = [
+            "def encode_fields(obj, objects):",
+            f"    key = obj.{id_attr}",
+            "    if key in objects:",
+            "        return None",
+        ]
+        record: List[str] = []
+        children: List[str] = []
+        for name, kind, _ in self.fields:
+            if kind == 'plain':
+                record.append(f"{name!r}: obj.{name}")
+            elif kind == 'date':
+                record.append(f"{name!r}: obj.{name}.isoformat()")
+            elif kind == 'ref':
+                lines.append(f"    v_{name} = obj.{name}")
+                record.append(f"{name!r}: None if v_{name} is None else v_{name}.{id_attr}")
+                children.append(f"*(() if v_{name} is None else (v_{name},))")
+            else:
+                lines.append(f"    v_{name} = obj.{name}")
+                record.append(f"{name!r}: [ref.{id_attr} for ref in v_{name}]")
+                children.append(f"*v_{name}")
+        lines.append(f"    return key, {{{', '.join(record)}}}, [{', '.join(children)}]")
+        return self._exec(lines, 'encode_fields')
+
+    def _compile_decode(self, id_attr: str, adders: Dict[str, str]):
+        signature = inspect.signature(self.cls.__init__)
+        params = list(signature.parameters)[1:]
+        by_name = {name: kind for name, kind, _ in self.fields}
+
+        args: List[str] = []
+        setters: List[str] = []
+        for name, kind, hint in self.fields:
+            if kind not in ('plain', 'date'):
+                continue
+            value = f"record[{name!r}]"
+            if kind == 'date':
+                value = f"_{hint.__name__}.fromisoformat({value})"
+            if name in params:
+                args.append(f"{name}={value}")
+            elif getattr(self.cls, name).fset is not None:
+                setters.append(f"    obj.{name} = {value}")
+        for name, parameter in signature.parameters.items():
+            if (name not in by_name and name != 'self'
+                    and parameter.default is inspect.Parameter.empty
+                    and parameter.kind not in (inspect.Parameter.VAR_POSITIONAL,
+                                               inspect.Parameter.VAR_KEYWORD)):
+                raise TypeError(f"{self.cls.__name__}: параметр {name} не property")
+
+        create = [
+            "def create(key, record, context):",
+            f"    obj = cls({', '.join(args + ['**context'])})",
+            *setters,
+            f"    obj.{id_attr} = key",
+            "    return obj",
+        ]
+
+        # ссылки восстанавливаются через метод из adders, add_<имя в ед. числе>
+        # или сеттер; чего нет - выясняется здесь, а не посреди декодирования
+        link = ["def link(obj, record, objects):", "    pass"]
+        for name, kind, _ in self.fields:
+            if kind == 'ref':
+                if getattr(self.cls, name).fset is None:
+                    raise TypeError(f"{self.cls.__name__}: у ссылки {name} нет сеттера")
+                value = f"None if record[{name!r}] is None else objects[record[{name!r}]]"
+                link.append(f"    obj.{name} = {value}")
+            elif kind == 'refs':
+                if name in adders:
+                    adder = adders[name]
+                    if not callable(getattr(self.cls, adder, None)):
+                        raise TypeError(f"{self.cls.__name__}: нет метода {adder} для {name}")
+                else:
+                    adder = next((f"add_{form}" for form in _singular_forms(name)
+                                  if callable(getattr(self.cls, f"add_{form}", None))), None)
+                if adder is not None:
+                    link.append(f"    add = obj.{adder}")
+                    link.append(f"    for ref_id in record[{name!r}]:")
+                    link.append(f"        add(objects[ref_id])")
+                elif getattr(self.cls, name).fset is not None:
+                    link.append(f"    obj.{name} = [objects[ref_id] for ref_id in record[{name!r}]]")
+                else:
+                    raise TypeError(f"{self.cls.__name__}: нельзя восстановить {name}")
+
+        return self._exec(create, 'create'), self._exec(link, 'link')
+
+    def _exec(self, lines: List[str], name: str):
+        namespace = {'cls': self.cls, '_datetime': dt.datetime, '_date': dt.date}
+        exec('\n'.join(lines), namespace)
+        return namespace[name]
+
+
+_compiled: Dict[Tuple[type, str], _CompiledClass] = {}
+_compiled_by_name: Dict[str, _CompiledClass] = {}
+
+
+def _compile(cls: type, id_attr: str) -> _CompiledClass:
+    """класс разбирается один раз, дальше берётся из кэша"""
+    compiled = _compiled.get((cls, id_attr))
+    if compiled is None:
+        compiled = _compiled[(cls, id_attr)] = _CompiledClass(cls, id_attr)
+        _compiled_by_name[compiled.type_name] = compiled
+    return compiled
+
+
+class CompiledEncoder:
+    """кодировщик любых классов с property через сгенерированный код"""
+
+    def __init__(self, id_attr: str = '_id') -> None:
+        self._id_attr = id_attr
+
+    def encode(self, obj: Any) -> bytes:
+        """для Person вывод совпадает с PersonEncoderPrivate"""
+        root_cls = type(obj)
+        objects: Dict[str, Dict] = {}
+
+        stack = [obj]
+        while stack:
+            current_obj = stack.pop()
+            compiled = _compile(type(current_obj), self._id_attr)
+            encoded = compiled.encode_fields(current_obj, objects)
+            if encoded is None:
+                continue
+            key, record, children = encoded
+
+            # объекты другого класса помечаются, чтобы декодер знал что создавать
+            if compiled.cls is not root_cls:
+                record['__class__'] = compiled.type_name
+            objects[key] = record
+            stack.extend(reversed(children))
+
+        data = {
+            'objects': objects,
+            'root_id': getattr(obj, self._id_attr)
+        }
+        return json.dumps(data, indent=2).encode('utf-8')
+
+
+class CompiledDecoder:
+    """декодер для CompiledEncoder, объекты создаются через конструктор"""
+
+    def __init__(self, cls: type, id_attr: str = '_id', others: Iterable[type] = (),
+                 adders: Optional[Dict[str, str]] = None) -> None:
+        """others - классы объектов, на которые ссылается cls;
+        adders - поле-список ссылок -> метод, добавляющий одну ссылку,
+        когда add_<имя в ед. числе> не подходит, например {'children': 'adopt'}
+        """
+        self._cls = cls
+        self._id_attr = id_attr
+        self._adders = dict(adders or {})
+        # функции восстановления собираются сразу: ошибка в классе видна
+        # при создании декодера, а не на середине данных
+        compiled = [_compile(klass, id_attr) for klass in (cls, *others)]
+        for klass in compiled:
+            klass.decode_functions(self._adders)
+        unknown = set(self._adders).difference(*(klass.ref_lists for klass in compiled))
+        if unknown:
+            raise TypeError(f"adders: нет полей-списков ссылок {sorted(unknown)}")
+
+    def decode(self, data: bytes, **context: Any) -> Any:
+        """context уходит в конструктор корневого класса, например graph для Person"""
+        if not context and hasattr(self._cls, '_decode_context'):
+            context = self._cls._decode_context()
+        json_data = json.loads(data.decode('utf-8'))
+        objects_data = json_data['objects']
+        root = _compile(self._cls, self._id_attr)
+
+        objects: Dict[str, Any] = {}
+        links = []
+        # create и link по классу, чтобы не разбирать adders на каждый объект
+        functions: Dict[_CompiledClass, Tuple[Callable, Callable]] = {}
+        for obj_id, obj_data in objects_data.items():
+            compiled = root
+            arguments = context
+            if '__class__' in obj_data:
+                arguments = {}
+                compiled = _compiled_by_name.get(obj_data['__class__'])
+                if compiled is None:
+                    raise ValueError(f"неизвестный класс {obj_data['__class__']}")
+            create_link = functions.get(compiled)
+            if create_link is None:
+                create_link = functions[compiled] = compiled.decode_functions(self._adders)
+            create, link = create_link
+            objects[obj_id] = create(obj_id, obj_data, arguments)
+            links.append(link)
+
+        for link, (obj_id, obj_data) in zip(links, objects_data.items()):
+            link(objects[obj_id], obj_data, objects)
+
+        return objects[json_data['root_id']]
+
+
+# формат индексированного снимка:
+#   заголовок | записи узлов | смещения записей по номеру узла | таблица id -> номер
+#   | born_in по возрастанию и номера узлов | таблица хеш имени -> номер
+# запись: uuid, born_in в микросекундах, длина имени, число друзей, имя, номера друзей
+_INDEX_MAGIC = b'PERSIDX2'
+_INDEX_HEADER = struct.Struct('<8sIIQQQQ')
+_INDEX_RECORD = struct.Struct('<16sqII')
+_INDEX_ID = struct.Struct('<16sI')
+_INDEX_NAME = struct.Struct('<8sI')
+_INDEX_BORN = struct.Struct('<q')
+_INDEX_OFFSET = struct.Struct('<Q')
+_INDEX_FRIEND = struct.Struct('<I')
+
+
+def _name_key(name: bytes) -> bytes:
+    # hash() у строк меняется между запусками, в файл пишем стабильный
+    return hashlib.blake2b(name, digest_size=8).digest()
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class IndexedEncoder:
+    """запись снимка с таблицей id -> смещение для чтения через mmap"""
+
+    def dump(self, obj: Person, path: str) -> None:
+        """сериализация графа в файл, узлы нумеруются в порядке обхода"""
+        nodes: List[Person] = []
+        numbers: Dict[str, int] = {}
+
+        stack = [obj]
+        while stack:
+            current_obj = stack.pop()
+            if current_obj._id in numbers:
+                continue
+            numbers[current_obj._id] = len(nodes)
+            nodes.append(current_obj)
+            stack.extend(reversed(current_obj._friends))
+
+        offsets = array('Q')
+        born = array('q')
+        names: List[Tuple[bytes, int]] = []
+        with open(path, 'wb') as f:
+            f.write(bytes(_INDEX_HEADER.size))
+
+            for person in nodes:
+                offsets.append(f.tell())
+                name = person.name.encode('utf-8')
+                friends = array('I', (numbers[friend._id] for friend in person.friends))
+                born.append(_to_micros(person.born_in))
+                names.append((_name_key(name), len(names)))
+                f.write(_INDEX_RECORD.pack(
+                    uuid.UUID(person._id).bytes,
+                    born[-1],
+                    len(name),
+                    len(friends)
+                ))
+                f.write(name)
+                f.write(_little_endian(friends))
+
+            offsets_pos = f.tell()
+            f.write(_little_endian(offsets))
+
+            # таблица отсортирована по uuid - поиск двоичный
+            ids_pos = f.tell()
+            ids = sorted((uuid.UUID(person._id).bytes, number)
+                         for number, person in enumerate(nodes))
+            f.write(b''.join(_INDEX_ID.pack(key, number) for key, number in ids))
+
+            # индексы пишутся готовыми, при открытии их не надо строить заново
+            born_pos = f.tell()
+            order = sorted(range(len(nodes)), key=born.__getitem__)
+            f.write(_little_endian(array('q', (born[number] for number in order))))
+            f.write(_little_endian(array('I', order)))
+
+            names_pos = f.tell()
+            names.sort()
+            f.write(b''.join(_INDEX_NAME.pack(key, number) for key, number in names))
+
+            f.seek(0)
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, len(nodes), 0,
+                                       offsets_pos, ids_pos, born_pos, names_pos))
+
+
+class LazyPerson:
+    """Person из снимка, данные читаются только при обращении"""
+
+    __slots__ = ('_snapshot', '_number', '_record', '_friend_numbers')
+
+    def __init__(self, snapshot: 'IndexedSnapshot', number: int) -> None:
+        self._snapshot = snapshot
+        self._number = number
+        self._record: Optional[Tuple[bytes, int, str, int]] = None
+        self._friend_numbers: Optional[array] = None
+
+    def _load(self) -> Tuple[bytes, int, str, int]:
+        if self._record is None:
+            self._record = self._snapshot._read_record(self._number)
+        return self._record
+
+    def add_friend(self, friend: 'LazyPerson') -> None:
+        raise TypeError("снимок только для чтения")
+
+    @property
+    def name(self) -> str:
+        return self._load()[2]
+
+    @property
+    def born_in(self) -> dt.datetime:
+        return _from_micros(self._load()[1])
+
+    @property
+    def friends(self) -> List['LazyPerson']:
+        if self._friend_numbers is None:
+            self._friend_numbers = self._snapshot._read_friends(self._number)
+        return [self._snapshot._person(number) for number in self._friend_numbers]
+
+    @property
+    def _id(self) -> str:
+        return str(uuid.UUID(bytes=self._load()[0]))
+
+    # те же поля что и у Person, чтобы снимок читали все кодировщики
+    _name = name
+    _born_in = born_in
+    _friends = friends
+
+
+class IndexedSnapshot:
+    """снимок, открытый через mmap, память растёт только по затронутым узлам"""
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self._count, self._root, self._offsets_pos, self._ids_pos,
+         self._born_pos, self._names_pos) = _INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != _INDEX_MAGIC:
+            self.close()
+            raise ValueError("не индексированный снимок")
+        self._people: Dict[int, LazyPerson] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self) -> 'IndexedSnapshot':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._people.clear()
+        self._mm.close()
+        self._file.close()
+
+    @property
+    def root(self) -> LazyPerson:
+        return self._person(self._root)
+
+    def get(self, person_id: str) -> Optional[LazyPerson]:
+        """поиск человека по id двоичным поиском по таблице"""
+        key = uuid.UUID(person_id).bytes
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, number = _INDEX_ID.unpack_from(
+                self._mm, self._ids_pos + middle * _INDEX_ID.size)
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self._person(number)
+        return None
+
+    def _lower_bound(self, pos: int, entry: struct.Struct, key: Any) -> int:
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if entry.unpack_from(self._mm, pos + middle * entry.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def born_between(self, start: dt.datetime, end: dt.datetime) -> List[LazyPerson]:
+        """люди с start <= born_in <= end по сохранённому индексу"""
+        low = self._lower_bound(self._born_pos, _INDEX_BORN, _to_micros(start))
+        # верхняя граница - первый ключ больше end
+        high = self._lower_bound(self._born_pos, _INDEX_BORN, _to_micros(end) + 1)
+        numbers_pos = self._born_pos + self._count * _INDEX_BORN.size
+        numbers = array('I')
+        numbers.frombytes(self._mm[numbers_pos + low * _INDEX_FRIEND.size:
+                                   numbers_pos + high * _INDEX_FRIEND.size])
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        return [self._person(number) for number in numbers]
+
+    def by_name(self, name: str) -> List[LazyPerson]:
+        key = _name_key(name.encode('utf-8'))
+        position = self._lower_bound(self._names_pos, _INDEX_NAME, key)
+        people = []
+        while position < self._count:
+            entry_key, number = _INDEX_NAME.unpack_from(
+                self._mm, self._names_pos + position * _INDEX_NAME.size)
+            if entry_key != key:
+                break
+            # совпадение хеша ещё не совпадение имени
+            person = self._person(number)
+            if person.name == name:
+                people.append(person)
+            position += 1
+        return people
+
+    def degree(self, person: LazyPerson) -> int:
+        return _INDEX_RECORD.unpack_from(self._mm, self._offset(person._number))[3]
+
+    def shortest_path(self, first: LazyPerson,
+                      second: LazyPerson) -> Optional[List[LazyPerson]]:
+        path = _shortest_path(self._read_friends, first._number, second._number)
+        if path is None:
+            return None
+        return [self._person(number) for number in path]
+
+    def neighbourhood(self, person: LazyPerson, hops: int = 2) -> List[LazyPerson]:
+        return [self._person(number)
+                for number in _neighbourhood(self._read_friends, person._number, hops)]
+
+    def _person(self, number: int) -> LazyPerson:
+        # один прокси на узел - равенство и `in` работают как у Person
+        person = self._people.get(number)
+        if person is None:
+            person = self._people[number] = LazyPerson(self, number)
+        return person
+
+    def _offset(self, number: int) -> int:
+        return _INDEX_OFFSET.unpack_from(
+            self._mm, self._offsets_pos + number * _INDEX_OFFSET.size)[0]
+
+    def _read_record(self, number: int) -> Tuple[bytes, int, str, int]:
+        offset = self._offset(number)
+        key, born_in, name_len, friend_count = _INDEX_RECORD.unpack_from(self._mm, offset)
+        start = offset + _INDEX_RECORD.size
+        name = self._mm[start:start + name_len].decode('utf-8')
+        return key, born_in, name, friend_count
+
+    def _read_friends(self, number: int) -> array:
+        offset = self._offset(number)
+        _, _, name_len, friend_count = _INDEX_RECORD.unpack_from(self._mm, offset)
+        start = offset + _INDEX_RECORD.size + name_len
+        friends = array('I')
+        friends.frombytes(self._mm[start:start + friend_count * _INDEX_FRIEND.size])
+        if sys.byteorder == 'big':
+            friends.byteswap()
+        return friends
+
+
+class AsyncPersonEncoder:
+    """запись снимка из event loop без долгой блокировки
+
+    формат - кадры "длина, перевод строки, JSON": заголовок с root_id, записи узлов
+    и завершающий кадр с их числом; длина в начале кадра снимает лимит
+    StreamReader на длину строки, а у человека могут быть тысячи друзей
+    """
+
+    def __init__(self, chunk_size: int = 1000) -> None:
+        self._chunk_size = chunk_size
+
+    async def encode(self, obj: Person, writer: Any) -> None:
+        """writer - asyncio.StreamWriter или объект с write() и async drain()"""
+        # срез берётся до первого await, add_friend из других задач его не меняет,
+        # даже если сливает граф с другим
+        view = obj._graph.view()
+        try:
+            writer.write(_json_frame({'root_id': obj._id}))
+            visited: Set[int] = set()
+            stack = [obj._number]
+            lines: List[bytes] = []
+            while stack:
+                number = stack.pop()
+                if number in visited:
+                    continue
+
+                visited.add(number)
+                friends = view.neighbours(number)
+                person = view.person(number)
+                lines.append(_json_frame({
+                    'id': person._id,
+                    'name': person.name,
+                    'born_in': person.born_in.isoformat(),
+                    'friends': [view.person(friend)._id for friend in friends]
+                }))
+                stack.extend(reversed(friends))
+
+                if len(lines) >= self._chunk_size:
+                    writer.write(b''.join(lines))
+                    lines = []
+                    # drain ждёт, пока буфер не разгрузится; sleep(0) отдаёт ход всегда
+                    await writer.drain()
+                    await asyncio.sleep(0)
+
+            lines.append(_json_frame({'count': len(visited)}))
+            writer.write(b''.join(lines))
+            await writer.drain()
+        finally:
+            view.close()
+
+
+class AsyncPersonDecoder:
+    """чтение снимка AsyncPersonEncoder порциями по chunk_size"""
+
+    def __init__(self, chunk_size: int = 1000) -> None:
+        self._chunk_size = chunk_size
+
+    async def decode(self, reader: Any, graph: Optional[PersonGraph] = None) -> Person:
+        """reader - asyncio.StreamReader или объект с async readline() и readexactly()"""
+        # каждый вызов строит свой граф, он освобождается вместе с результатом
+        if graph is None:
+            graph = PersonGraph()
+        header = await _read_frame(reader)
+        if header is None:
+            raise ValueError("снимок оборван")
+        objects: Dict[str, Person] = {}
+        friends: List[Tuple[Person, List[str]]] = []
+        count = None
+
+        while True:
+            obj_data = await _read_frame(reader)
+            if obj_data is None:
+                break
+            if 'count' in obj_data:
+                count = obj_data['count']
+                break
+
+            born_in = dt.datetime.fromisoformat(obj_data['born_in'])
+            person = Person(obj_data['name'], born_in, graph)
+            person._id = obj_data['id']
+            objects[obj_data['id']] = person
+            friends.append((person, obj_data['friends']))
+            if len(objects) % self._chunk_size == 0:
+                await asyncio.sleep(0)
+
+        if count != len(objects):
+            raise ValueError("снимок оборван")
+
+        for done, (person, friend_ids) in enumerate(friends, 1):
+            for friend_id in friend_ids:
+                person.add_friend(objects[friend_id])
+            if done % self._chunk_size == 0:
+                await asyncio.sleep(0)
+
+        return objects[header['root_id']]
+
+
+def _json_frame(data: Dict[str, Any]) -> bytes:
+    payload = json.dumps(data).encode('utf-8')
+    return b'%d\n' % len(payload) + payload
+
+
+async def _read_frame(reader: Any) -> Optional[Dict[str, Any]]:
+    # None - поток закончился, в том числе посреди кадра
+    size = await reader.readline()
+    if not size:
+        return None
+    try:
+        payload = await reader.readexactly(int(size))
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(payload)
+
+
 if __name__ == "__main__":
     p1 = Person("Kirill", dt.datetime(2006, 7, 27))
     p2 = Person("Alina", dt.datetime(2006, 8, 28))
@@ -178,6 +1681,92 @@ if __name__ == "__main__":
     print(f"Друзей: {len(recreated_p1_public._friends)}")
     print(f"Имена друзей: {recreated_p1_public._friends[0]._name}")
 
+    print("\nдельта-снимки")
+    delta_encoder = DeltaEncoder()
+    delta_decoder = DeltaDecoder()
+
+    base = delta_encoder.encode(p1)
+    p3 = Person("Maxim", dt.datetime(2005, 1, 15))
+    p2.add_friend(p3)
+    delta = delta_encoder.encode(p1)
+
+    recreated_p1_delta = delta_decoder.decode(base, [delta])
+    print(f"Узлов в дельте: {len(json.loads(delta)['objects'])}")
+    print(f"Друзей у друга: {len(recreated_p1_delta.friends[0].friends)}")
+    print(f"Размер после свёртки: {len(delta_decoder.compact(base, [delta]))} байт")
+
+    # Ivan не менялся и в базе его нет, но дельта везёт его как друга Olga
+    base_private = encoder_private.encode(p1)
+    delta_encoder = DeltaEncoder(Person.current_generation(), base_private)
+    p4 = Person("Olga", dt.datetime(2004, 4, 4))
+    p4.add_friend(Person("Ivan", dt.datetime(2003, 3, 3)))
+    p3.add_friend(p4)
+    recreated_p1_delta = delta_decoder.decode(base_private, [delta_encoder.encode(p1)])
+    recreated_p4 = recreated_p1_delta.graph().index.by_name("Olga")[0]
+    print(f"Друзья Olga после дельты: {[friend.name for friend in recreated_p4.friends]}")
+
+    print("\nиндексированный снимок")
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, 'people.idx')
+        IndexedEncoder().dump(p1, snapshot_path)
+        with IndexedSnapshot(snapshot_path) as snapshot:
+            lazy_p3 = snapshot.get(p3._id)
+            print(f"Людей в снимке: {len(snapshot)}")
+            print(f"Найден по id: {lazy_p3.name}, {lazy_p3.born_in.date()}")
+            print(f"Друг корня: {snapshot.root.friends[0].name}")
+            print(f"Путь до Maxim: {[person.name for person in snapshot.shortest_path(snapshot.root, lazy_p3)]}")
+
+    print("\nиндексы графа")
+    index = p1.graph().index
+    print(f"Родились в 2006: {[person.name for person in index.born_between(dt.datetime(2006, 1, 1), dt.datetime(2006, 12, 31))]}")
+    print(f"Друзья друзей Kirill: {[person.name for person in index.neighbourhood(p1, 2)]}")
+    print(f"Степень Alina: {index.degree(p2)}")
+
+    print("\nсгенерированный сериализатор")
+    encoded_compiled = CompiledEncoder().encode(p1)
+    recreated_p1_compiled = CompiledDecoder(Person).decode(encoded_compiled)
+
+    print(f"Совпадает с PersonEncoderPrivate: {encoded_compiled == encoder_private.encode(p1)}")
+    print(f"Имя: {recreated_p1_compiled.name}")
+    print(f"Друзей: {len(recreated_p1_compiled.friends)}")
+
+    print("\nасинхронная запись")
+
+    async def async_round_trip(root: Person, chunk_size: int, during=None) -> Person:
+        left, right = socket.socketpair()
+        _, writer = await asyncio.open_connection(sock=left)
+        reader, reader_writer = await asyncio.open_connection(sock=right)
+
+        async def write() -> None:
+            await AsyncPersonEncoder(chunk_size).encode(root, writer)
+            writer.close()
+
+        async def change() -> None:
+            if during is not None:
+                await asyncio.sleep(0)
+                during()
+
+        results = await asyncio.gather(
+            write(), change(), AsyncPersonDecoder(chunk_size).decode(reader))
+        reader_writer.close()
+        return results[2]
+
+    # друг, добавленный во время записи, в снимок не попадает
+    recreated_p1_async = asyncio.run(async_round_trip(
+        p1, 1, lambda: p3.add_friend(Person("Late", dt.datetime(2007, 3, 3)))))
+    print(f"Имя: {recreated_p1_async.name}")
+    print(f"Людей сейчас: {len(p1.graph())}")
+    print(f"Людей в снимке: {len(recreated_p1_async.graph())}")
+
+    # запись человека с 2000 друзей длиннее лимита строки StreamReader (64 КиБ)
+    hub_graph = PersonGraph()
+    hub = Person("Hub", dt.datetime(2000, 1, 1), hub_graph)
+    for number in range(2000):
+        hub.add_friend(Person(f"Friend{number}", dt.datetime(2001, 1, 1), hub_graph))
+    recreated_hub = asyncio.run(async_round_trip(hub, 1000))
+    print(f"Друзей у Hub: {len(recreated_hub.friends)}, "
+          f"снимки совпадают: {encoder_private.encode(recreated_hub) == encoder_private.encode(hub)}")
+
 
 # ООП стиль без нарушения инкапсуляции:
 #   Отличия от других подходов:
@@ -0,0 +1,312 @@
+"""сравнение способов сериализации Person из 1.py и 2.py на синтетических графах
+
+python bench.py --sizes 10 100 1000 --shapes random chain --output bench.json
+"""
+import argparse
+import datetime as dt
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _load(name: str, filename: str) -> Any:
+    # 1.py и 2.py нельзя импортировать обычным import
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+oop = _load('lab3_oop', '1.py')
+functional = _load('lab3_functional', '2.py')
+
+
+# генераторы графов: make_person(name, born_in) -> Person, возвращают корень и число рёбер
+
+def random_graph(make_person: Callable, nodes: int, rng: random.Random,
+                 degree: int = 4) -> Tuple[Any, int]:
+    """случайные пары, в среднем degree друзей на человека"""
+    people = _people(make_person, nodes, rng)
+    # сначала остовное дерево, чтобы весь граф был достижим из корня
+    for number in range(1, nodes):
+        people[number].add_friend(people[rng.randrange(number)])
+    for _ in range(max(0, nodes * degree // 2 - (nodes - 1))):
+        first, second = rng.randrange(nodes), rng.randrange(nodes)
+        if first != second:
+            people[first].add_friend(people[second])
+    return people[0], _edges(people)
+
+
+def power_law_graph(make_person: Callable, nodes: int, rng: random.Random,
+                    links: int = 2) -> Tuple[Any, int]:
+    """предпочтительное присоединение Барабаши-Альберт"""
+    people = _people(make_person, nodes, rng)
+    # каждый конец ребра лежит в списке - выбор пропорционален степени
+    ends: List[int] = [0]
+    for number in range(1, nodes):
+        for _ in range(min(links, number)):
+            friend = ends[rng.randrange(len(ends))]
+            if friend != number:
+                people[number].add_friend(people[friend])
+                ends.extend((number, friend))
+    return people[0], _edges(people)
+
+
+def chain_graph(make_person: Callable, nodes: int, rng: random.Random) -> Tuple[Any, int]:
+    """длинная цепочка, максимальная глубина обхода"""
+    people = _people(make_person, nodes, rng)
+    for first, second in zip(people, people[1:]):
+        first.add_friend(second)
+    return people[0], _edges(people)
+
+
+def clique_graph(make_person: Callable, nodes: int, rng: random.Random,
+                 size: int = 32) -> Tuple[Any, int]:
+    """кольцо из полных подграфов по size человек"""
+    people = _people(make_person, nodes, rng)
+    starts = list(range(0, nodes, size))
+    for start in starts:
+        group = people[start:start + size]
+        for i, first in enumerate(group):
+            for second in group[i + 1:]:
+                first.add_friend(second)
+    ring = list(zip(starts, starts[1:]))
+    if len(starts) > 2:
+        ring.append((starts[-1], starts[0]))
+    for first, second in ring:
+        people[first].add_friend(people[second])
+    return people[0], _edges(people)
+
+
+def _edges(people: List[Any]) -> int:
+    # add_friend пропускает повторные пары, поэтому считаем по факту
+    return sum(len(person.friends) for person in people) // 2
+
+
+def _people(make_person: Callable, nodes: int, rng: random.Random) -> List[Any]:
+    start = dt.datetime(1950, 1, 1)
+    return [make_person(f"person{number}", start + dt.timedelta(days=rng.randrange(25000)))
+            for number in range(nodes)]
+
+
+SHAPES = {
+    'random': random_graph,
+    'power_law': power_law_graph,
+    'chain': chain_graph,
+    'clique': clique_graph,
+}
+
+
+def _make_oop_person() -> Callable:
+    # свой граф на каждый прогон, чтобы память освобождалась
+    graph = oop.PersonGraph()
+    return lambda name, born_in: oop.Person(name, born_in, graph)
+
+
+def _make_functional_person() -> Callable:
+    return functional.Person
+
+
+def _decode_compiled(data: bytes) -> Any:
+    return oop.CompiledDecoder(oop.Person).decode(data, graph=oop.PersonGraph())
+
+
+# make_person, encode, decode; в отчёт пишутся классы исходного и восстановленного Person,
+# чтобы не сравнивать кодировщики на разных хранилищах, не видя этого
+STRATEGIES: Dict[str, Tuple[Callable, Callable, Callable]] = {
+    'PersonEncoderPrivate': (_make_oop_person, oop.PersonEncoderPrivate().encode,
+                             oop.PersonDecoderPrivate().decode),
+    'PersonEncoderPublic': (_make_oop_person, oop.PersonEncoderPublic().encode,
+                            oop.PersonDecoderPublic().decode),
+    'encode_person_functional_correct': (_make_functional_person,
+                                         functional.encode_person_functional_correct,
+                                         functional.decode_person_functional_correct),
+    'encode_person_functional_incorrect': (_make_functional_person,
+                                           functional.encode_person_functional_incorrect,
+                                           functional.decode_person_functional_incorrect),
+    'CompiledEncoder': (_make_oop_person, oop.CompiledEncoder().encode, _decode_compiled),
+    # функциональные кодировщики на Person из 1.py - то же хранилище, что у ООП стратегий
+    'encode_person_functional_correct_graph': (_make_oop_person,
+                                               functional.encode_person_functional_correct,
+                                               functional.decode_person_functional_correct),
+    'encode_person_functional_incorrect_graph': (_make_oop_person,
+                                                 functional.encode_person_functional_incorrect,
+                                                 functional.decode_person_functional_incorrect),
+}
+
+# рекурсивным кодировщикам нужен глубокий стек: на цепочке глубина равна числу узлов
+_STACK_SIZE = 1024 * 1024 * 1024
+
+
+def _best_time(action: Callable, repeat: int) -> Tuple[float, Any]:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        result = None
+        start = time.perf_counter()
+        result = action()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _peak_memory(action: Callable) -> int:
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _with_deep_stack(action: Callable, depth: int) -> Any:
+    """action в отдельном потоке с большим стеком и поднятым лимитом рекурсии"""
+    outcome: Dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            outcome['value'] = action()
+        except BaseException as error:
+            outcome['error'] = error
+
+    previous_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(previous_limit, depth))
+    previous_size = threading.stack_size(_STACK_SIZE)
+    try:
+        worker = threading.Thread(target=run)
+        worker.start()
+    finally:
+        threading.stack_size(previous_size)
+    worker.join()
+    sys.setrecursionlimit(previous_limit)
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['value']
+
+
+def measure(strategy: str, shape: str, nodes: int, repeat: int, memory: bool,
+            seed: int = 0) -> Dict[str, Any]:
+    """один прогон: кодирование и декодирование одного графа"""
+    make_person, encode, decode = STRATEGIES[strategy]
+    start = time.perf_counter()
+    root, edges = SHAPES[shape](make_person(), nodes, random.Random(seed))
+    result: Dict[str, Any] = {
+        'strategy': strategy,
+        'shape': shape,
+        'nodes': nodes,
+        'edges': edges,
+        'person': _class_name(root),
+        'build_s': time.perf_counter() - start,
+        'error': None,
+    }
+    if memory:
+        result['build_peak_bytes'] = _peak_memory(
+            lambda: SHAPES[shape](make_person(), nodes, random.Random(seed)))
+
+    def run() -> None:
+        encode_s, data = _best_time(lambda: encode(root), repeat)
+        decode_s, decoded = _best_time(lambda: decode(data), repeat)
+        result.update({
+            'size_bytes': len(data),
+            'encode_s': encode_s,
+            'decode_s': decode_s,
+            'encode_nodes_per_s': nodes / encode_s if encode_s else None,
+            'decode_nodes_per_s': nodes / decode_s if decode_s else None,
+            'decoded_person': _class_name(decoded),
+            'root_friends_match': len(decoded.friends) == len(root.friends),
+        })
+        decoded = None
+        if memory:
+            result['encode_peak_bytes'] = _peak_memory(lambda: encode(root))
+            result['decode_peak_bytes'] = _peak_memory(lambda: decode(data))
+
+    try:
+        _with_deep_stack(run, 2 * nodes + 1000)
+    except RecursionError:
+        # не хватило даже увеличенного стека
+        result['error'] = 'RecursionError'
+    return result
+
+
+def _class_name(obj: Any) -> str:
+    # модули загружены как lab3_oop и lab3_functional, по ним видно, чей Person
+    return f"{type(obj).__module__}.{type(obj).__qualname__}"
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """замедления относительно прошлого отчёта больше чем на tolerance"""
+    previous = {(item['strategy'], item['shape'], item['nodes']): item for item in baseline}
+    regressions = []
+    for item in results:
+        old = previous.get((item['strategy'], item['shape'], item['nodes']))
+        if old is None or item['error'] or old['error']:
+            continue
+        for key in ('encode_s', 'decode_s', 'size_bytes'):
+            if item[key] > old[key] * (1 + tolerance):
+                regressions.append(
+                    f"{item['strategy']} {item['shape']} {item['nodes']}: "
+                    f"{key} {old[key]:.6g} -> {item[key]:.6g}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="число людей, можно до 1000000")
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES),
+                        default=list(STRATEGIES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="не замерять пиковую память (tracemalloc медленный)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="файл для JSON отчёта, иначе stdout")
+    parser.add_argument('--baseline', help="прошлый JSON отчёт для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = []
+    for shape in args.shapes:
+        for nodes in args.sizes:
+            for strategy in args.strategies:
+                result = measure(strategy, shape, nodes, args.repeat,
+                                 not args.no_memory, args.seed)
+                results.append(result)
+                print(f"{shape:>9} {nodes:>8} {strategy:<42} "
+                      f"{result['error'] or '%.4fs / %.4fs' % (result['encode_s'], result['decode_s'])}",
+                      file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())